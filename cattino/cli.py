@@ -1,9 +1,11 @@
 import builtins
+import calendar
+import ctypes
 import gettext
 import itertools
 import os
 import re
-import runpy
+import select
 import shlex
 import shutil
 import socket
@@ -17,7 +19,6 @@ import rich
 from rich.table import Table
 from rich.console import Console
 from datetime import datetime
-from pathlib import Path
 from typing import Any, Callable, List, Literal, Optional, Sequence, Tuple
 
 
@@ -35,6 +36,8 @@ from cattino.utils import (
     split_params,
 )
 
+PROGRESS_BAR_PATTERN = re.compile(r"\d+%\|.*\| \d+/\d+")
+
 
 def print_response(
     response: Response,
@@ -48,25 +51,23 @@ def print_response(
     take a list of task names and returns a message to be printed.
 
     For success_msg_fn, it should additionally handle the case when the response.ok() is True.
+    Producers are only called for messages that will actually be printed.
     """
-    success_msg = success_msg_fn(getattr(response, "success", None))
-    failure_msg = failure_msg_fn(getattr(response, "failure", None))
-    no_op_msg = no_op_msg_fn(getattr(response, "no_op", None)) if no_op_msg_fn else None
+    if response.error():
+        click.echo(response.detail)
+        sys.exit(1)
 
     def echo(msg: Optional[str]):
         if msg:
             click.echo(msg)
 
+    echo(success_msg_fn(getattr(response, "success", None)))
     if response.ok():
-        echo(success_msg)
-    else:
-        if response.error():
-            click.echo(response.detail)
-            sys.exit(1)
-        echo(success_msg)
-        echo(no_op_msg)
-        echo(failure_msg)
-        echo(response.detail)
+        return
+    if no_op_msg_fn:
+        echo(no_op_msg_fn(getattr(response, "no_op", None)))
+    echo(failure_msg_fn(getattr(response, "failure", None)))
+    echo(response.detail)
 
 
 def get_path_tree_str(names: List[str]):
@@ -76,6 +77,154 @@ def get_path_tree_str(names: List[str]):
     return str(tree)
 
 
+# verb -> (past tense, message for tasks on which the operation has no effect)
+RESPONSE_MESSAGES = {
+    "create": ("created", "already exists, skipping creation."),
+    "cancel": ("cancelled", "are not in waiting status."),
+    "resume": ("resumed", "are not cancelled."),
+    "kill": ("killed", "are not running."),
+    "remove": ("removed", None),
+}
+
+
+def standard_print(response: Response, verb: str):
+    """
+    Print the response of an operation on tasks, e.g. `create` or `kill`, with
+    the messages registered for `verb` in `RESPONSE_MESSAGES`.
+    """
+    past, no_op_msg = RESPONSE_MESSAGES[verb]
+
+    def success_msg_fn(success: Optional[List[str]]) -> Optional[str]:
+        if response.ok():
+            return f"{len(success) if success else 0} tasks {past} successfully."
+        return f"{get_path_tree_str(success)} {past} successfully." if success else None
+
+    def failure_msg_fn(failure: Optional[List[str]]) -> Optional[str]:
+        return f"{get_path_tree_str(failure)} failed to {verb}." if failure else None
+
+    def no_op_msg_fn(no_op: Optional[List[str]]) -> Optional[str]:
+        return f"{get_path_tree_str(no_op)} {no_op_msg}" if no_op else None
+
+    print_response(
+        response, success_msg_fn, failure_msg_fn, no_op_msg_fn if no_op_msg else None
+    )
+
+
+def parse_list(value: str) -> List[str]:
+    """
+    Expand a multirun value like `[a,b,c]` into its items. Other values are
+    returned as a single-item list.
+    """
+    if len(value) >= 2 and value[0] == "[" and value[-1] == "]":
+        return split_params(value[1:-1])
+    return [value]
+
+
+def is_progress_bar(line: str) -> bool:
+    # every tqdm bar contains "%|", so most log lines are rejected without regex
+    return "%|" in line and PROGRESS_BAR_PATTERN.search(line) is not None
+
+
+class FileChangeWaiter:
+    """
+    Block until an opened file is written to. It uses inotify on Linux and kqueue on
+    BSD/macOS, and falls back to sleeping for the whole timeout on other platforms.
+    """
+
+    IN_MODIFY = 0x00000002
+
+    def __init__(self, file: Any):
+        self._inotify_fd: Optional[int] = None
+        self._kqueue = None
+
+        if sys.platform.startswith("linux"):
+            try:
+                # the running interpreter is already linked against libc
+                libc = ctypes.CDLL(None, use_errno=True)
+                fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+                if fd >= 0:
+                    wd = libc.inotify_add_watch(
+                        fd, os.fsencode(file.name), self.IN_MODIFY
+                    )
+                    if wd >= 0:
+                        self._inotify_fd = fd
+                    else:
+                        os.close(fd)
+            except (OSError, AttributeError):
+                self._inotify_fd = None
+        elif hasattr(select, "kqueue"):
+            try:
+                self._kqueue = select.kqueue()
+                self._kqueue.control(
+                    [
+                        select.kevent(
+                            file.fileno(),
+                            filter=select.KQ_FILTER_VNODE,
+                            flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                            fflags=select.KQ_NOTE_WRITE | select.KQ_NOTE_EXTEND,
+                        )
+                    ],
+                    0,
+                    0,
+                )
+            except OSError:
+                if self._kqueue is not None:
+                    self._kqueue.close()
+                self._kqueue = None
+
+    def wait(self, timeout: float):
+        """Wait until the file changes or the timeout expires."""
+        if self._inotify_fd is not None:
+            ready, _, _ = select.select([self._inotify_fd], [], [], timeout)
+            if ready:
+                # drain pending events, we only care that something happened
+                try:
+                    os.read(self._inotify_fd, 4096)
+                except BlockingIOError:
+                    pass
+        elif self._kqueue is not None:
+            self._kqueue.control(None, 1, timeout)
+        else:
+            time.sleep(timeout)
+
+    def close(self):
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        if self._kqueue is not None:
+            self._kqueue.close()
+            self._kqueue = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def run_script(code: Any, path: str) -> dict:
+    """
+    Execute a compiled script as `__main__` and return its globals, like
+    `runpy.run_path(path, run_name="__main__")` does without reading the file again.
+    """
+    import types
+
+    module = types.ModuleType("__main__")
+    module.__dict__.update(
+        __file__=path, __cached__=None, __loader__=None, __package__=None, __spec__=None
+    )
+    original_main = sys.modules.get("__main__")
+    sys.modules["__main__"] = module
+    try:
+        exec(code, module.__dict__)
+    finally:
+        if original_main is None:
+            del sys.modules["__main__"]
+        else:
+            sys.modules["__main__"] = original_main
+    return module.__dict__.copy()
+
+
 class MagicString(click.ParamType):
     name = "magic_string"
 
@@ -87,6 +236,11 @@ class MagicString(click.ParamType):
 
 
 class DateTime(click.DateTime):
+    # matches every supported format with zero-padded fields in one pass
+    DATETIME_PATTERN = re.compile(
+        r"(\d{4})(?:-(\d{2})(?:-(\d{2})(?:([ T])(\d{2})(?::(\d{2})(?::(\d{2}))?)?)?)?)?"
+    )
+
     def __init__(
         self,
         formats: Optional[Sequence[str]] = None,
@@ -123,13 +277,48 @@ class DateTime(click.DateTime):
         )
         self.fill_default = fill_default
 
+    def fast_convert(self, value: str) -> Optional[datetime]:
+        """
+        Parse `value` with `DATETIME_PATTERN` and fill the missing fields according to
+        `fill_default`. Returns None if the value should go through `strptime` instead.
+        """
+        if not (m := self.DATETIME_PATTERN.fullmatch(value)):
+            return None
+        year, month, day, sep, hour, minute, second = m.groups()
+        fmt = "%Y"
+        for field, part in (
+            (month, "-%m"),
+            (day, "-%d"),
+            (hour, f"{sep}%H"),
+            (minute, ":%M"),
+            (second, ":%S"),
+        ):
+            if field is not None:
+                fmt += part
+        if fmt not in self.formats:
+            return None
+
+        latest = self.fill_default == "latest"
+        try:
+            y = int(year)
+            mo = int(month) if month else (12 if latest else 1)
+            d = int(day) if day else (calendar.monthrange(y, mo)[1] if latest else 1)
+            h = int(hour) if hour else (23 if latest else 0)
+            mi = int(minute) if minute else (59 if latest else 0)
+            sec = int(second) if second else (59 if latest else 0)
+            return datetime(y, mo, d, h, mi, sec)
+        except ValueError:
+            return None
+
     def convert(
         self, value: str, param: Optional[click.Parameter], ctx: Optional[click.Context]
     ) -> Any:
-        if self.fill_default == "earliest":
-            return super().convert(value, param, ctx)
         if isinstance(value, datetime):
             return value
+        if (date_obj := self.fast_convert(value)) is not None:
+            return date_obj
+        if self.fill_default == "earliest":
+            return super().convert(value, param, ctx)
 
         for fmt in self.formats:
             try:
@@ -138,7 +327,12 @@ class DateTime(click.DateTime):
                     return date_obj.replace(date_obj.year, 12, 31, 23, 59, 59)
                 if fmt == "%Y-%m":
                     return date_obj.replace(
-                        date_obj.year, date_obj.month, 31, 23, 59, 59
+                        date_obj.year,
+                        date_obj.month,
+                        calendar.monthrange(date_obj.year, date_obj.month)[1],
+                        23,
+                        59,
+                        59,
                     )
                 if fmt == "%Y-%m-%d":
                     return date_obj.replace(
@@ -213,9 +407,9 @@ def meow():
     """
     Meow meow~
     """
-    import pkg_resources  # type: ignore[import]
+    from importlib.metadata import version
 
-    click.echo(f"Cattino: {pkg_resources.get_distribution('cattino').version}")
+    click.echo(f"Cattino: {version('cattino')}")
 
 
 @main.command()
@@ -315,19 +509,13 @@ def create(
 
     if multirun and args:
         list_args = []
-        parse_list = lambda value: (
-            split_params(value[1:-1])
-            if value.startswith("[") and value.endswith("]")
-            else [value]
-        )
-
         for arg in args:
             arg = Magics.resolve(
                 arg, run_dir=run_dir, task_name=task_name, fullname=fullname
             )
 
-            if "=" in arg:
-                key, value = arg.split("=", 1)
+            key, sep, value = arg.partition("=")
+            if sep:
                 list_args.append([f"{key}={v}" for v in parse_list(value)])
             else:
                 list_args.append(parse_list(arg))
@@ -353,9 +541,12 @@ def create(
     if os.path.isfile(input) and input.endswith(".py"):
         original_argv = sys.argv
         tasks = []
+        # compile once, the script is executed for every multirun combination
+        with open(input, "rb") as f:
+            code = compile(f.read(), input, "exec", dont_inherit=True)
         for ex_args in extra_args:
             sys.argv = [input] + builtins.list(ex_args)
-            task_list = runpy.run_path(input, run_name="__main__").get(TASK_GLOBALS_KEY)
+            task_list = run_script(code, input).get(TASK_GLOBALS_KEY)
             if not task_list:
                 click.echo(
                     "The input file does not contain a valid task object with command\n"
@@ -371,17 +562,18 @@ def create(
     # case 2: input is a command string
     else:
         try:
-            cmds = [
-                shlex.split(input) + builtins.list(ex_args) for ex_args in extra_args
-            ]
+            base_cmd = shlex.split(input)
         except ValueError as e:
             click.echo(f"Invalid command string: {e}")
             sys.exit(1)
         cmd_strs = [
             Magics.resolve(
-                " ".join(cmd), run_dir=run_dir, task_name=task_name, fullname=fullname
+                " ".join(base_cmd + builtins.list(ex_args)),
+                run_dir=run_dir,
+                task_name=task_name,
+                fullname=fullname,
             )
-            for cmd in cmds
+            for ex_args in extra_args
         ]
         tasks = [[override_attrs(ProcTask(cmd_str))] for cmd_str in cmd_strs]
 
@@ -398,24 +590,7 @@ def create(
         ),
         extra_paths=extra_paths,
     )
-    print_response(
-        response,
-        lambda success: (
-            f"{len(success) if success else 0} tasks created successfully."
-            if response.ok()
-            else (
-                f"{get_path_tree_str(success)} created successfully."
-                if success
-                else None
-            )
-        ),
-        lambda failure: (
-            f"{get_path_tree_str(failure)} failed to create." if failure else None
-        ),
-        lambda no_op: (
-            f"{get_path_tree_str(no_op)} already exists, skipping creation." if no_op else None
-        ),
-    )
+    standard_print(response, "create")
 
 
 @main.command()
@@ -499,13 +674,11 @@ def watch(fullname: Optional[str], stream: str):
         click.echo(f"{fullname} does not exist or has not started yet.")
         sys.exit(1)
 
-    PROGRESS_BAR_PATTERN = re.compile(r"\d+%\|.*\| \d+/\d+")
     is_running = threading.Event()
 
     def running_test():
         """Monitor whether the process is running"""
-        while not is_running.is_set():
-            time.sleep(2)
+        while not is_running.wait(2):
             try:
                 if not Request.test(fullname).ok():
                     is_running.set()
@@ -517,11 +690,10 @@ def watch(fullname: Optional[str], stream: str):
 
     with open_redirected_stream(task_cache_dir, stream, "r") as f:
         # filter progress bars, and only output the last states
-        exist_lines = f.readlines()
         last_progress_bar = None
-        for line in exist_lines:
+        for line in f:
             line = line.rstrip("\n")
-            if PROGRESS_BAR_PATTERN.search(line):
+            if is_progress_bar(line):
                 last_progress_bar = line
             else:
                 if last_progress_bar:
@@ -536,19 +708,21 @@ def watch(fullname: Optional[str], stream: str):
         # cache_nl ensures the progress bar is refreshed correctly. for tqdm, it outputs
         # the progress bar followed by a newline. ignoring this newline allows proper refreshing.
         cache_nl = False
-        while not is_running.is_set():
-            if (line := f.readline()) == "\n":
-                cache_nl = True
-            elif line:
-                if PROGRESS_BAR_PATTERN.search(line):
-                    click.echo("\r" + line, nl=False)
+        with FileChangeWaiter(f) as waiter:
+            while not is_running.is_set():
+                if (line := f.readline()) == "\n":
+                    cache_nl = True
+                elif line:
+                    if is_progress_bar(line):
+                        click.echo("\r" + line, nl=False)
+                    else:
+                        if cache_nl:
+                            click.echo()
+                            cache_nl = False
+                        click.echo(line, nl=False)
                 else:
-                    if cache_nl:
-                        click.echo()
-                        cache_nl = False
-                    click.echo(line, nl=False)
-            else:
-                time.sleep(0.5)
+                    # the timeout only bounds how late we notice the task has ended
+                    waiter.wait(0.5)
 
         click.echo()
 
@@ -572,24 +746,7 @@ def cancel(all: bool, name: Optional[str]):
         sys.exit(1)
 
     response = Request.cancel(name, use_regex=all)
-    print_response(
-        response,
-        lambda success: (
-            f"{len(success) if success else 0} tasks cancelled successfully."
-            if response.ok()
-            else (
-                f"{get_path_tree_str(success) } cancelled successfully."
-                if success
-                else None
-            )
-        ),
-        lambda failure: (
-            f"{get_path_tree_str(failure) } failed to cancell." if failure else None
-        ),
-        lambda no_op: (
-            f"{get_path_tree_str(no_op) } are not in waiting status." if no_op else None
-        ),
-    )
+    standard_print(response, "cancel")
 
 
 @main.command()
@@ -610,26 +767,7 @@ def resume(all: bool, name: Optional[str]):
         sys.exit(1)
 
     response = Request.resume(name, use_regex=all)
-    print_response(
-        response,
-        lambda success: (
-            f"{len(success) if success else 0} tasks resumed successfully."
-            if response.ok()
-            else (
-                f"{get_path_tree_str(success) } resumed successfully."
-                if success
-                else None
-            )
-        ),
-        lambda failure: (
-            f"{get_path_tree_str(failure) } failed to resume." if failure else None
-        ),
-        lambda no_op: (
-            f"{get_path_tree_str(no_op) } are not cancelled."
-            if no_op
-            else None
-        ),
-    )
+    standard_print(response, "resume")
 
 
 @main.command()
@@ -664,24 +802,7 @@ def kill(all: bool, force: bool, name: Optional[str]):
         sys.exit(1)
 
     response = Request.kill(name, force=force, use_regex=all)
-    print_response(
-        response,
-        lambda success: (
-            f"{len(success) if success else 0} tasks killed successfully."
-            if response.ok()
-            else (
-                f"{get_path_tree_str(success) } killed successfully."
-                if success
-                else None
-            )
-        ),
-        lambda failure: (
-            f"{get_path_tree_str(failure) } failed to kill." if failure else None
-        ),
-        lambda no_op: (
-            f"{get_path_tree_str(no_op) } are not running." if no_op else None
-        ),
-    )
+    standard_print(response, "kill")
 
 
 @main.command
@@ -708,21 +829,7 @@ def remove(all: bool, name: Optional[str]):
         sys.exit(1)
 
     response = Request.remove(name, use_regex=all)
-    print_response(
-        response,
-        lambda success: (
-            f"{len(success) if success else 0} tasks removed successfully."
-            if response.ok()
-            else (
-                f"{get_path_tree_str(success)} removed successfully."
-                if success
-                else None
-            )
-        ),
-        lambda failure: (
-            f"{get_path_tree_str(failure)} failed to remove." if failure else None
-        ),
-    )
+    standard_print(response, "remove")
 
 
 @main.command()
@@ -763,16 +870,15 @@ def retrieve_setting_help():
     Retrieve the documentation for all settings with the following format:
     - `setting-name` (`setting_type`): `setting_description`
     """
-    keys = builtins.list(settings.default_settings.keys())
-    types = [settings.get_type(key).__name__ for key in keys]
-    descriptions = [settings.get_description(key) for key in keys]
     return "\n".join(
-        f"- {key.replace('_', '-')} ({type}): {description}"
-        for key, type, description in zip(keys, types, descriptions)
+        f"- {key.replace('_', '-')} ({settings.get_type(key).__name__}): "
+        f"{settings.get_description(key)}"
+        for key in settings.default_settings
     )
 
 
-set_docstring = f"""
+def retrieve_set_docstring():
+    return f"""
 Change the settings of cattino or an attribute of a task.
 To set the attribute of a task, use the format `task_fullname.attr_name`.
 
@@ -783,7 +889,30 @@ Available settings:
 """
 
 
-@main.command(help=set_docstring)
+class LazyHelpCommand(click.Command):
+    """
+    A command whose help text is produced by `help_factory` the first time it is
+    displayed, so that building it does not slow down every other command.
+    """
+
+    _help: Optional[str] = None
+
+    def __init__(self, *args, help_factory: Callable[[], str], **kwargs):
+        self._help_factory = help_factory
+        super().__init__(*args, **kwargs)
+
+    @property
+    def help(self) -> Optional[str]:  # type: ignore[override]
+        if self._help is None:
+            self._help = self._help_factory()
+        return self._help
+
+    @help.setter
+    def help(self, value: Optional[str]):
+        self._help = value
+
+
+@main.command(cls=LazyHelpCommand, help_factory=retrieve_set_docstring)
 @click.argument("setting_or_task_attr", type=str)
 @click.argument("value", type=MagicString())
 def set(setting_or_task_attr: str, value: str):
@@ -811,9 +940,10 @@ def set(setting_or_task_attr: str, value: str):
 
         try:
             assert key is not None
-            old_value = settings.all_settings[key]
+            # only dump the changed field instead of the whole `all_settings`
+            old_value = settings.model_dump(include={key})[key]
             setattr(settings, key, value)
-            if settings.all_settings[key] != old_value:
+            if settings.model_dump(include={key})[key] != old_value:
                 click.echo(f"Setting {setting} updated to {value}.")
         except Exception as e:
             click.echo(f"Error setting {setting}: {e}")
@@ -857,35 +987,40 @@ def clean(
     """
     Clean up the cache directory based on the specified date and time options.
     """
-    cattino_home = get_cattino_home()
+    cattino_home = os.path.normpath(get_cattino_home())
     response = Request.test()
     current_cache_dir = (
         get_cache_dir("backend", response.pid) if hasattr(response, "pid") else None  # type: ignore
     )
+    # a path is in use if it is the current cache dir, or one of its ancestors or
+    # descendants. all paths below are normalized, so plain prefix checks suffice.
+    current_cache_prefix = (
+        os.path.join(current_cache_dir, "") if current_cache_dir else ""
+    )
 
-    def remove_cache(path: str, force: bool = False):
-        if not os.path.exists(path):
-            return False
-        # NOTE: in some platforms, getctime may return the last modified time
-        # instead of the creation time
-        create_time = datetime.fromtimestamp(os.path.getctime(path)).replace(
-            microsecond=0
+    def is_in_use(path: str) -> bool:
+        return bool(current_cache_dir) and (
+            path == current_cache_dir
+            or path.startswith(current_cache_prefix)
+            or current_cache_prefix.startswith(os.path.join(path, ""))
         )
+
+    def remove_cache(path: str, ctime: float, force: bool = False):
+        # NOTE: in some platforms, ctime may be the last modified time
+        # instead of the creation time
+        create_time = datetime.fromtimestamp(ctime).replace(microsecond=0)
         if (
             force
             or (before and create_time <= before)
             or (after and create_time >= after)
         ):
-            if current_cache_dir and (
-                os.path.commonpath([current_cache_dir, path])
-                in [current_cache_dir, path]
-            ):
+            if is_in_use(path):
                 click.echo(f"{path} is currently in use, skipping deletion.")
                 return False
             if verbose:
                 click.echo(f"Deleting: {path}")
             try:
-                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+                shutil.rmtree(path)
                 return True
             except OSError as e:
                 click.echo(f"Error deleting {path}: {e}")
@@ -901,36 +1036,37 @@ def clean(
         if response.error():
             settings.clear()
 
-    cache_list = [
-        str(dirs.parent)
-        for dirs in Path(cattino_home).rglob("backend")
-        if dirs.is_dir()
-    ]
-    # build directory tree to remove empty parent dir
-    tree: dict = {}
-    for path in cache_list:
-        current = tree
-        for part in Path(path.removeprefix(cattino_home)).parts:
-            current = current.setdefault(part, {})
-
-    def clean_dir_tree(prefix: str, d: dict):
-        for k, v in d.copy().items():
-            path = os.path.join(prefix, k)
-            if v == {}:
-                # now, we have reached the leaf node
-                if remove_cache(path, force=all):
-                    del d[k]
-            else:
-                if clean_dir_tree(path, v):
-                    del d[k]
-
-        return remove_cache(prefix, force=all) if prefix and not d else False
-
-    # change the key name of the root directory to ensure
-    # os.path.join works correctly. Otherwise, os.path.join(path, "/")
-    # will always return the root directory "/".
-    tree[""] = tree.pop("/", {})
-    clean_dir_tree(cattino_home, tree)
+    def clean_dir(path: str, ctime: float, is_root: bool = False) -> Tuple[bool, bool]:
+        """
+        Walk `path` once and clean it in post-order, so that parent directories left
+        empty by the removal of their caches are removed in the same pass.
+        Returns whether `path` contains any cache, and whether `path` has been removed.
+        """
+        try:
+            with os.scandir(path) as it:
+                sub_dirs = [
+                    entry for entry in it if entry.is_dir(follow_symlinks=False)
+                ]
+        except PermissionError:
+            # skip unreadable directories, as `Path.rglob` does
+            return False, False
+
+        # a cache directory of one run always contains the cache of its backend
+        if any(entry.name == "backend" for entry in sub_dirs):
+            return True, remove_cache(path, ctime, force=all)
+
+        has_cache, all_removed = False, True
+        for entry in sub_dirs:
+            sub_has_cache, sub_removed = clean_dir(entry.path, entry.stat().st_ctime)
+            if sub_has_cache:
+                has_cache = True
+                all_removed = all_removed and sub_removed
+
+        if all_removed and (has_cache or is_root):
+            return has_cache, remove_cache(path, ctime, force=all)
+        return has_cache, False
+
+    clean_dir(cattino_home, os.stat(cattino_home).st_ctime, is_root=True)
 
     click.echo(f"Clean completed from {cattino_home}.")
 
@@ -1,3 +1,4 @@
+import functools
 import importlib
 import inspect
 import itertools
@@ -24,8 +25,41 @@ from typing import (
 from cattino.constants import CATTINO_HOME, CACHE_DIR_FORMAT, DEFAULT_CATTINO_HOME
 
 if TYPE_CHECKING:
+    from cattino.settings import Settings
     from cattino.tasks.interface import AbstractTask
 
+# constants for `is_valid_filename`, built once at import time
+_IS_WINDOWS = os.name == "nt"
+_FS_ENCODING = sys.getfilesystemencoding()
+_WINDOWS_RESERVED_FILE_NAMES = frozenset(
+    (
+        "CON",
+        "PRN",
+        "AUX",
+        "CLOCK$",
+        "NUL",
+        *(f"{name}{num}" for name in ("COM", "LPT") for num in range(10)),
+        *(
+            f"{name}{ssd}"
+            for name in ("COM", "LPT")
+            for ssd in (
+                "\N{SUPERSCRIPT ONE}",
+                "\N{SUPERSCRIPT TWO}",
+                "\N{SUPERSCRIPT THREE}",
+            )
+        ),
+    )
+)
+_MACOS_RESERVED_FILE_NAMES = frozenset((":",))
+_INVALID_PATH_CHARS = "".join(
+    chr(c) for c in range(128) if chr(c) not in string.printable
+)
+_INVALID_FILENAME_CHARS = _INVALID_PATH_CHARS + "/"
+_INVALID_WIN_PATH_CHARS = _INVALID_PATH_CHARS + ':*?"<>|\t\n\r\x0b\x0c'
+_INVALID_WIN_FILENAME_CHARS = _INVALID_FILENAME_CHARS + _INVALID_WIN_PATH_CHARS + "\\"
+_INVALID_FILENAME_SET = frozenset(_INVALID_FILENAME_CHARS)
+_INVALID_WIN_FILENAME_SET = frozenset(_INVALID_WIN_FILENAME_CHARS)
+
 
 def import_pynvml():
     """
@@ -60,12 +94,13 @@ def import_pynvml():
     return pynvml
 
 
+@functools.lru_cache(maxsize=1024)
 def resolve_obj_by_qualname(fullname: str) -> Any:
     """
-    Resolve an object by its fully qualified name.
+    Resolve an object by its fully qualified name. Results are cached.
     """
     module_name, obj_name = fullname.rsplit(".", 1)
-    module = importlib.import_module(module_name)
+    module = sys.modules.get(module_name) or importlib.import_module(module_name)
     return getattr(module, obj_name)
 
 
@@ -74,8 +109,10 @@ def get_cattino_home() -> str:
     Get the path to the cache directory.
     """
     if CATTINO_HOME != DEFAULT_CATTINO_HOME:
+        # the directory may be removed while we are running, so make sure it
+        # exists on every call and only cache the path resolution
         os.makedirs(CATTINO_HOME, exist_ok=True)
-        return os.path.abspath(CATTINO_HOME)
+        return _abspath_in(os.getcwd(), CATTINO_HOME)
 
     search_path = [
         os.path.join(os.getcwd(), "cattino-dev"),
@@ -86,10 +123,15 @@ def get_cattino_home() -> str:
             # if user installed cattino with editable mode, the source code will be
             # located in os.path.join(os.getcwd(), "cattino"). we can't save logs in
             # source dir, because `meow clean` will delete source code unexpectedly.
-            if "setup.py" not in os.listdir(path):
+            if not os.path.isfile(os.path.join(path, "setup.py")):
                 return path
     os.makedirs(DEFAULT_CATTINO_HOME, exist_ok=True)
-    return DEFAULT_CATTINO_HOME
+    return os.path.normpath(DEFAULT_CATTINO_HOME)
+
+
+@functools.lru_cache(maxsize=8)
+def _abspath_in(cwd: str, path: str) -> str:
+    return os.path.normpath(os.path.join(cwd, path))
 
 
 @overload
@@ -123,13 +165,47 @@ def get_cache_dir(filename_or_task, backend_pid=None) -> str:  # type: ignore
             fullname=filename_or_task.fullname,
         )
 
-    cache_dir = os.path.join(
-        get_cattino_home(),
-        datetime.fromtimestamp(psutil.Process(backend_pid).create_time()).strftime(
-            format_str
-        ),
+    pid = os.getpid()
+    if backend_pid is None or backend_pid == pid:
+        create_time = _own_create_time(pid)
+    else:
+        # pids of other processes may be reused by a new process, so always ask
+        create_time = psutil.Process(backend_pid).create_time()
+    home, name = get_cattino_home(), _format_timestamp(create_time, format_str)
+    if _is_plain_relpath(name):
+        # home is already normalized, so a plain relative name can be appended as is
+        return f"{home}{os.sep}{name}"
+    return os.path.normpath(os.path.join(home, name))
+
+
+def _is_plain_relpath(path: str) -> bool:
+    """
+    Check whether `path` is a relative path that `os.path.normpath` would leave
+    untouched, i.e. it has no empty, `.` or `..` components, no alternative
+    separators and no drive.
+    """
+    sep = os.sep
+    return (
+        bool(path)
+        and "." not in path
+        and ":" not in path
+        and (os.altsep is None or os.altsep not in path)
+        and not path.startswith(sep)
+        and not path.endswith(sep)
+        and sep + sep not in path
     )
-    return os.path.normpath(cache_dir)
+
+
+@functools.lru_cache(maxsize=8)
+def _own_create_time(pid: int) -> float:
+    # only called with the pid of the current process, which can't be reused while
+    # we are alive. keyed on the pid so that forked children don't see the parent's.
+    return psutil.Process(pid).create_time()
+
+
+@functools.lru_cache(maxsize=256)
+def _format_timestamp(timestamp: float, format_str: str) -> str:
+    return datetime.fromtimestamp(timestamp).strftime(format_str)
 
 
 def open_redirected_stream(cache_dir: str, stream: str, mode: str = "w") -> Any:
@@ -141,6 +217,35 @@ def open_redirected_stream(cache_dir: str, stream: str, mode: str = "w") -> Any:
     return open(os.path.join(cache_dir, f"{stream}.log"), mode, buffering=1)
 
 
+@functools.lru_cache(maxsize=2048)
+def _cached_signature(func) -> inspect.Signature:
+    return inspect.signature(func)
+
+
+@functools.lru_cache(maxsize=1024)
+def _flatten_annotation(annotation) -> tuple:
+    """
+    Expand an annotation into the classes that `has_param_type` matches against,
+    e.g. `Optional[List[int]]` becomes `(list, NoneType)`.
+    """
+    origin = get_origin(annotation)
+    if origin is None:
+        return (annotation,)
+    if origin is Union:
+        return tuple(
+            base for arg in get_args(annotation) for base in _annotation_bases(arg)
+        )
+    return (origin,)
+
+
+def _annotation_bases(annotation) -> tuple:
+    try:
+        return _flatten_annotation(annotation)
+    except TypeError:
+        # unhashable annotations can't be cached
+        return _flatten_annotation.__wrapped__(annotation)
+
+
 def has_param_type(func, types: tuple[type, ...], index: Optional[int] = None) -> bool:
     """
     Check whether a function has a parameter (at a given position or anywhere)
@@ -157,30 +262,32 @@ def has_param_type(func, types: tuple[type, ...], index: Optional[int] = None) -
         that matches any of the provided types (directly or via subclass).
         False otherwise.
     """
-    sig = inspect.signature(func)
-    params = list(sig.parameters.values())
+    try:
+        sig = _cached_signature(func)
+    except TypeError:
+        # unhashable callables can't be cached
+        sig = inspect.signature(func)
+    concrete_types = tuple(tp for tp in types if isinstance(tp, type))
 
     def matches(annotation):
-        origin = get_origin(annotation)
-        if origin is None:
-            return any(
-                issubclass(tp, annotation) for tp in types if isinstance(tp, type)
-            )
-        if origin is Union:
-            return any(matches(arg) for arg in get_args(annotation))
-        return any(issubclass(tp, origin) for tp in types if isinstance(tp, type))
+        return any(
+            issubclass(tp, base)
+            for base in _annotation_bases(annotation)
+            for tp in concrete_types
+        )
 
     # if index is specified, only check that parameter
     if index is not None:
-        if index >= len(params):
+        param = next(itertools.islice(sig.parameters.values(), index, index + 1), None)
+        if param is None:
             return False
-        ann = params[index].annotation
+        ann = param.annotation
         return ann is not inspect.Parameter.empty and matches(ann)
 
     # check all parameters
     return any(
         matches(p.annotation)
-        for p in params
+        for p in sig.parameters.values()
         if p.annotation is not inspect.Parameter.empty
     )
 
@@ -191,7 +298,6 @@ def is_valid_filename(
     """
     Check if filename is a valid filename in current platform.
     """
-    is_windows = os.name == "nt"
     unicode_filename = str(filename)
 
     # precheck
@@ -199,54 +305,30 @@ def is_valid_filename(
         return False
 
     # check length
-    byte_ct = len(unicode_filename.encode(sys.getfilesystemencoding()))
+    # ascii characters are one byte each in every filesystem encoding we run on,
+    # so only other names need to be encoded to be measured
+    if unicode_filename.isascii():
+        byte_ct = len(unicode_filename)
+    else:
+        byte_ct = len(unicode_filename.encode(_FS_ENCODING))
     min_len, max_len = 1, 255
     if not min_len <= byte_ct < max_len:
         return False
 
     # check reserve keyworks
-    additional_reserved = tuple(additional_reserved) if additional_reserved else ()
-    _WINDOWS_RESERVED_FILE_NAMES = additional_reserved + (
-        ("CON", "PRN", "AUX", "CLOCK$", "NUL")
-        + tuple(
-            f"{name:s}{num:d}"
-            for name, num in itertools.product(("COM", "LPT"), range(0, 10))
-        )
-        + tuple(
-            f"{name:s}{ssd:s}"
-            for name, ssd in itertools.product(
-                ("COM", "LPT"),
-                ("\N{SUPERSCRIPT ONE}", "\N{SUPERSCRIPT TWO}", "\N{SUPERSCRIPT THREE}"),
-            )
-        )
-    )
-    _MACOS_RESERVED_FILE_NAMES = additional_reserved + (":",)
-
-    if is_windows:
-        if unicode_filename in _WINDOWS_RESERVED_FILE_NAMES:
+    if additional_reserved and unicode_filename in additional_reserved:
+        return False
+    if _IS_WINDOWS:
+        # reserved names are case-insensitive on windows
+        if unicode_filename.upper() in _WINDOWS_RESERVED_FILE_NAMES:
             return False
     else:
         if unicode_filename in _MACOS_RESERVED_FILE_NAMES:
             return False
-    unprintable_ascii_chars = [
-        chr(c) for c in range(128) if chr(c) not in string.printable
-    ]
-    _INVALID_PATH_CHARS = "".join(unprintable_ascii_chars)
-    _INVALID_FILENAME_CHARS = _INVALID_PATH_CHARS + "/"
-    _INVALID_WIN_PATH_CHARS = _INVALID_PATH_CHARS + ':*?"<>|\t\n\r\x0b\x0c'
-    _INVALID_WIN_FILENAME_CHARS = (
-        _INVALID_FILENAME_CHARS + _INVALID_WIN_PATH_CHARS + "\\"
-    )
-    _RE_INVALID_FILENAME = re.compile(
-        f"[{re.escape(_INVALID_FILENAME_CHARS):s}]", re.UNICODE
-    )
-    _RE_INVALID_WIN_FILENAME = re.compile(
-        f"[{re.escape(_INVALID_WIN_FILENAME_CHARS):s}]", re.UNICODE
-    )
 
-    if _RE_INVALID_FILENAME.findall(unicode_filename):
+    if not _INVALID_FILENAME_SET.isdisjoint(unicode_filename):
         return False
-    if is_windows and _RE_INVALID_WIN_FILENAME.findall(unicode_filename):
+    if _IS_WINDOWS and not _INVALID_WIN_FILENAME_SET.isdisjoint(unicode_filename):
         return False
 
     return True
@@ -283,6 +365,25 @@ def split_params(params_str: str) -> List[str]:
 import re
 from cattino.utils import split_params
 
+_settings: Optional["Settings"] = None
+
+
+def _get_settings() -> "Settings":
+    """
+    Get the global settings. `cattino.settings` depends on this module, so it can't
+    be imported at the top, and importing it inside every caller is not free either.
+    """
+    global _settings
+    if _settings is None:
+        from cattino.settings import settings
+
+        _settings = settings
+    return _settings
+
+
+# matches `${...}`, allowing one level of nested braces inside, e.g. `${eval:{1: 2}}`
+_RE_MAGICS = re.compile(r"\${([^{}]*(?:\{[^{}]*\}[^{}]*)*)}")
+
 
 class Magics:
     """Magic variables and resolvers for cattino."""
@@ -290,29 +391,37 @@ class Magics:
     @classmethod
     def resolve(cls, string: str, **kwargs) -> str:
         """Resolve magic variables and functions in a string."""
-        from cattino.settings import settings
-
-        MAGICS = re.compile(r"\${([^{}]*(?:\{[^{}]*\}[^{}]*)*)}")
+        if "${" not in string:
+            # most strings have no placeholders, skip the regex
+            return string.strip()
+        settings = _get_settings()
 
         def _resolve(match):
             expr = match.group(1)
-            try:
-                if ":" in expr:
-                    resolver_name, params_str = expr.split(":", 1)
+            if ":" in expr:
+                resolver_name, params_str = expr.split(":", 1)
+                resolver = settings.resolvers.get(resolver_name)
+                if resolver is None:
+                    return match.group(0)
+                try:
+                    # split_params already strips each parameter, so plain ones
+                    # need no resolving at all
                     params = [
-                        cls.resolve(p, **kwargs) for p in split_params(params_str)
+                        p if "${" not in p else cls.resolve(p, **kwargs)
+                        for p in split_params(params_str)
                     ]
-                    return str(settings.resolvers[resolver_name](*params))
-                else:
-                    if expr in settings.magic_constants:
-                        return settings.magic_constants[expr]
-                    if kwargs.get(expr) is not None:
-                        return kwargs[expr]
-            except Exception:
-                ...
+                    return str(resolver(*params))
+                except Exception:
+                    # resolvers run user code, which may fail until the placeholders
+                    # it depends on are resolved. keep the expression as is.
+                    return match.group(0)
+            if (value := settings.magic_constants.get(expr)) is not None:
+                return value
+            if (value := kwargs.get(expr)) is not None:
+                return value
             return match.group(0)
 
-        new_string = MAGICS.sub(_resolve, string.strip())
+        new_string = _RE_MAGICS.sub(_resolve, string.strip())
         while string != new_string:
             string = new_string
             new_string = cls.resolve(new_string, **kwargs)
@@ -321,7 +430,7 @@ class Magics:
     @classmethod
     def register_new_resolver(cls, name: str, func):
         """Register a new resolver."""
-        from cattino.settings import settings
+        settings = _get_settings()
 
         if not callable(func):
             raise ValueError(f"Resolver {name} is not callable.")
@@ -333,16 +442,19 @@ class Magics:
     @classmethod
     def register_new_variable(cls, name: str):
         """Register a new magic variable."""
-        from cattino.settings import settings
+        settings = _get_settings()
 
         if not isinstance(name, str):
             raise ValueError(f"Variable {name} is not a string.")
-        settings.magic_vars = list(set(settings.magic_vars + [name]))
+        magic_vars = settings.magic_vars
+        if name in magic_vars:
+            return
+        settings.magic_vars = [*magic_vars, name]
 
     @classmethod
     def register_new_constant(cls, name: str, value: str):
         """Register a new magic variable."""
-        from cattino.settings import settings
+        settings = _get_settings()
 
         if not isinstance(name, str) or not isinstance(value, str):
             raise ValueError(f"The name and value of the constant must be string.")